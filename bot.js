@@ -2,8 +2,9 @@ import 'dotenv/config';
 import TelegramBot from 'node-telegram-bot-api';
 import EventSource from 'eventsource';
 import { loadSettings, saveSettings } from './utils/settings.js';
-import { updateGithub } from './utils/github.js';
+import { scheduleGithubSync, flushGithubSync } from './utils/github.js';
 import { isBotAccount } from './utils/botCheck.js';
+import { httpsAgent, MAX_CONCURRENT_SENDS } from './utils/http.js';
 import { notifyError, notifyConfigChange, notifySystemEvent } from './utils/notifier.js';
 
 // Configuration
@@ -13,11 +14,19 @@ const config = {
   adminIds: process.env.ADMIN_IDS ? process.env.ADMIN_IDS.split(',') : []
 };
 
-// Initialize bot with polling
+// Initialize bot with long polling: getUpdates is held open for up to 50s,
+// so the request timeout must outlast it. The interval is also the only pause
+// between failed polls, so it must stay non-zero.
 const bot = new TelegramBot(config.telegramToken, {
-  polling: true,
+  polling: {
+    interval: 1000,
+    params: {
+      timeout: 50
+    }
+  },
   request: {
-    timeout: 20000
+    timeout: 60000,
+    agent: httpsAgent
   }
 });
 
@@ -30,14 +39,88 @@ Object.keys(settings).forEach(chatId => {
 
 console.log('Loaded settings for groups:', Object.keys(settings).join(', ') || 'none');
 
-// Event deduplication tracking
-const processedEvents = new Set();
-const MAX_PROCESSED_EVENTS = 1000;
+// Dispatch index: wiki -> event type -> [chatId] for active groups
+let dispatchIndex = new Map();
+// Raw `"wiki":"..."` fragments used to reject unwatched events before parsing
+let watchedWikiTokens = [];
+
+function rebuildDispatchIndex() {
+  const index = new Map();
+  Object.entries(settings).forEach(([chatId, groupConfig]) => {
+    if (groupStatus[chatId] !== 'active' || !groupConfig.wiki) return;
+    if (!index.has(groupConfig.wiki)) {
+      index.set(groupConfig.wiki, new Map());
+    }
+    const byType = index.get(groupConfig.wiki);
+    new Set(groupConfig.events || []).forEach(type => {
+      if (!byType.has(type)) {
+        byType.set(type, []);
+      }
+      byType.get(type).push(chatId);
+    });
+  });
+  dispatchIndex = index;
+  watchedWikiTokens = [...index.keys()].map(wiki => `"wiki":"${wiki}"`);
+}
+
+function isWatchedPayload(payload) {
+  for (const token of watchedWikiTokens) {
+    if (payload.includes(token)) return true;
+  }
+  return false;
+}
+
+rebuildDispatchIndex();
+
+// Event deduplication tracking: event key -> first seen (ms), oldest first.
+// Catches events replayed by the stream after a reconnect.
+const processedEvents = new Map();
+const MAX_PROCESSED_EVENTS = 4096;
+const PROCESSED_EVENT_TTL = 60000;
+
+function isDuplicateEvent(data) {
+  const id = data.meta?.id ?? data.id;
+  if (id == null) return false;
+
+  const key = `${data.wiki}:${id}`;
+  const now = Date.now();
+
+  // Map iterates in insertion order, so expired entries sit at the front
+  for (const [seenKey, seenAt] of processedEvents) {
+    if (now - seenAt < PROCESSED_EVENT_TTL && processedEvents.size < MAX_PROCESSED_EVENTS) break;
+    processedEvents.delete(seenKey);
+  }
+
+  if (processedEvents.has(key)) return true;
+  processedEvents.set(key, now);
+  return false;
+}
 
 // Initialize Wikimedia EventStream
 let eventSource;
+// Stream position of the last received event, sent back on reconnect to resume
+let lastEventId = '';
+
+// Reconnect backoff: consecutive failures since the last stable connection
+const RECONNECT_BASE_DELAY = 500;
+const RECONNECT_MAX_DELAY = 60000;
+const STABLE_CONNECTION_TIME = 60000;
+let reconnectAttempts = 0;
+let connectedAt = null; // Monotonic (performance.now) time of the current connection
+
+// Resolved base URLs per wiki; the set of wikis seen here is small and stable
+const wikiBaseUrls = new Map();
 
 function getWikiBaseUrl(wiki) {
+  let baseUrl = wikiBaseUrls.get(wiki);
+  if (!baseUrl) {
+    baseUrl = resolveWikiBaseUrl(wiki);
+    wikiBaseUrls.set(wiki, baseUrl);
+  }
+  return baseUrl;
+}
+
+function resolveWikiBaseUrl(wiki) {
   if (wiki === 'commonswiki') {
     return 'https://commons.wikimedia.org';
   }
@@ -49,7 +132,7 @@ function getWikiBaseUrl(wiki) {
   
   if (!matches) {
     console.warn(`Unknown wiki format: ${wiki}, defaulting to Wikipedia`);
-    return `https://${wiki.replace('wiki', '')}.wikipedia.org`;
+    return `https://${wiki.replace(/wiki$/, '')}.wikipedia.org`;
   }
   
   const [, lang, project] = matches;
@@ -82,11 +165,13 @@ function connectToEventStream() {
   // Add User-Agent identification
   eventSource = new EventSource(config.eventStreamUrl, {
     headers: {
-      'User-Agent': 'WikimediaMonitorBot/1.0 (+https://yourdomain.com/bot)'
+      'User-Agent': 'WikimediaMonitorBot/1.0 (+https://yourdomain.com/bot)',
+      ...(lastEventId && { 'Last-Event-ID': lastEventId })
     }
   });
 
   eventSource.onopen = () => {
+    connectedAt = performance.now();
     console.log('✅ Connected to Wikimedia EventStream');
     notifySystemEvent('EventStream Connected', 'Successfully connected to Wikimedia EventStream');
   };
@@ -97,26 +182,34 @@ function connectToEventStream() {
       eventSource.close();
     }
 
+    // A connection that stayed up long enough clears the failure streak
+    if (connectedAt !== null && performance.now() - connectedAt >= STABLE_CONNECTION_TIME) {
+      reconnectAttempts = 0;
+    }
+    connectedAt = null;
+
     // Handle different error types
-    let retryAfter;
+    let retryDelay;
     if (err.status === 429) {
       // For 429 errors, prioritize the Retry-After header (165 seconds in your case)
-      retryAfter = err.event?.target?.responseHeaders?.['retry-after'] || 
+      const retryAfter = err.event?.target?.responseHeaders?.['retry-after'] || 
                   err.response?.headers?.['retry-after'] || 
                   165; // Default to 165s if header missing
+
+      // Calculate delay with safety limits
+      retryDelay = Math.min(
+        300000, // Cap at 5 minutes (300 seconds)
+        Math.max(
+          2000, // Minimum 2 second delay
+          parseInt(retryAfter) * 1000 // Convert to milliseconds
+        )
+      );
     } else {
-      // For non-429 errors, use faster retry
-      retryAfter = 2;
+      // Capped exponential backoff with jitter so retries don't arrive in lockstep
+      const backoff = Math.min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * 2 ** reconnectAttempts);
+      retryDelay = Math.round(backoff * (0.5 + Math.random()));
     }
-
-    // Calculate delay with safety limits
-    const retryDelay = Math.min(
-      300000, // Cap at 5 minutes (300 seconds)
-      Math.max(
-        2000, // Minimum 2 second delay
-        parseInt(retryAfter) * 1000 // Convert to milliseconds
-      )
-    );
+    reconnectAttempts++;
 
     console.error(`❌ EventStream error (Status: ${err.status}). Retrying in ${retryDelay/1000}s...`);
     notifyError(err, `Connection error (HTTP ${err.status}). Retrying in ${retryDelay/1000} seconds`);
@@ -127,34 +220,34 @@ function connectToEventStream() {
   };
 
   eventSource.onmessage = (event) => {
+    if (event.lastEventId) {
+      lastEventId = event.lastEventId;
+    }
+
+    // Most of the firehose is for wikis nobody watches; skip those unparsed
+    const payload = event.data;
+    if (!isWatchedPayload(payload)) return;
+
     try {
-      const data = JSON.parse(event.data);
+      const data = JSON.parse(payload);
+
+      // Resolve subscribed groups first; the rest only runs for matches
+      const byType = dispatchIndex.get(data.wiki);
+      if (!byType) return;
+
+      const targets = byType.get(data.type === 'log' ? data.log_type : data.type);
+      if (!targets) return;
 
       // Skip events from bot accounts
       if (isBotAccount(data)) {
         return;
       }
 
-      const eventId = `${data.meta?.dt || Date.now()}-${data.wiki}-${data.title}-${data.type}-${data.user || data.performer?.user_text || ''}`;
-      
-      if (processedEvents.has(eventId)) return;
-      
-      processedEvents.add(eventId);
-      if (processedEvents.size > MAX_PROCESSED_EVENTS) {
-        const first = processedEvents.values().next().value;
-        processedEvents.delete(first);
-      }
+      if (isDuplicateEvent(data)) return;
 
-      const wiki = data.wiki || data.meta?.domain;
-      const type = data.type === 'log' ? data.log_type : data.type;
-
-      Object.entries(settings).forEach(([chatId, groupConfig]) => {
-        if (groupStatus[chatId] === 'active' && 
-            groupConfig.wiki === wiki && 
-            groupConfig.events.includes(type)) {
-          sendNotification(chatId, data);
-        }
-      });
+      // Render once per event, not once per subscribed group
+      const text = formatNotification(data);
+      targets.forEach(chatId => queueNotification(chatId, text));
     } catch (err) {
       console.error('Error processing event:', err);
       notifyError(err, 'Error processing EventStream message');
@@ -162,18 +255,18 @@ function connectToEventStream() {
   };
 }
 
-function sendNotification(chatId, data) {
-  // Enhanced MarkdownV2 escaping (includes all reserved characters)
-  const escapeMarkdownV2 = (text) => {
-    if (!text) return text;
-    return text.replace(/[_*[\]()~`>#+\-=|{}.!]/g, '\\$&');
-  };
+// Enhanced MarkdownV2 escaping (includes all reserved characters)
+function escapeMarkdownV2(text) {
+  if (!text) return text;
+  return text.replace(/[_*[\]()~`>#+\-=|{}.!]/g, '\\$&');
+}
 
-  // Clean URLs for Markdown (handle parentheses and other special chars)
-  const cleanUrl = (url) => {
-    return url.replace(/\)/g, '%29').replace(/\(/g, '%28');
-  };
+// Clean URLs for Markdown (handle parentheses and other special chars)
+function cleanUrl(url) {
+  return url.replace(/\)/g, '%29').replace(/\(/g, '%28');
+}
 
+function formatNotification(data) {
   const title = escapeMarkdownV2(data.title || data.log_title || 'Unknown');
   const user = data.user || data.performer?.user_text || 'Anonymous';
   const wiki = data.wiki || 'enwiki';
@@ -270,9 +363,69 @@ function sendNotification(chatId, data) {
     messageParts.push(`📊 Initial size: ${data.length.new} bytes`);
   }
 
+  return messageParts.join('\n');
+}
+
+// Per-group batching: notifications arriving within the window go out as one message
+const BATCH_WINDOW = 1500;
+const MAX_MESSAGE_LENGTH = 4096;
+const BATCH_SEPARATOR = '\n\n';
+const pendingBatches = new Map();
+
+function queueNotification(chatId, text) {
+  let batch = pendingBatches.get(chatId);
+
+  // Send what we have rather than exceed Telegram's message size limit
+  if (batch && batch.length + BATCH_SEPARATOR.length + text.length > MAX_MESSAGE_LENGTH) {
+    flushBatch(chatId);
+    batch = null;
+  }
+
+  if (!batch) {
+    batch = {
+      parts: [],
+      length: 0,
+      timer: setTimeout(() => flushBatch(chatId), BATCH_WINDOW)
+    };
+    pendingBatches.set(chatId, batch);
+  } else {
+    batch.length += BATCH_SEPARATOR.length;
+  }
+
+  batch.parts.push(text);
+  batch.length += text.length;
+}
+
+function flushBatch(chatId) {
+  const batch = pendingBatches.get(chatId);
+  if (!batch) return;
+
+  clearTimeout(batch.timer);
+  pendingBatches.delete(chatId);
+  sendNotification(chatId, batch.parts.join(BATCH_SEPARATOR));
+}
+
+// Bounded fan-out for Telegram sends so event bursts can't pile up unlimited requests
+// (MAX_CONCURRENT_SENDS lives in utils/http.js so the agent pool is sized to fit it)
+const MAX_QUEUED_SENDS = 10000;
+const sendQueue = [];
+let activeSends = 0;
+
+function drainSendQueue() {
+  while (activeSends < MAX_CONCURRENT_SENDS && sendQueue.length > 0) {
+    const task = sendQueue.shift();
+    activeSends++;
+    task().finally(() => {
+      activeSends--;
+      drainSendQueue();
+    });
+  }
+}
+
+function sendNotification(chatId, text) {
   const sendMessageWithRetry = async (attempt = 1) => {
     try {
-      await bot.sendMessage(chatId, messageParts.join('\n'), {
+      await bot.sendMessage(chatId, text, {
         parse_mode: 'MarkdownV2',
         disable_web_page_preview: true
       });
@@ -287,7 +440,14 @@ function sendNotification(chatId, data) {
     }
   };
 
-  sendMessageWithRetry();
+  // Shed load instead of growing without limit if Telegram stalls
+  if (sendQueue.length >= MAX_QUEUED_SENDS) {
+    console.warn(`Send queue full, dropping notification for ${chatId}`);
+    return;
+  }
+
+  sendQueue.push(sendMessageWithRetry);
+  drainSendQueue();
 }
 
 const commands = [
@@ -358,9 +518,11 @@ bot.onText(/\/setwiki (.+)/, async (msg, match) => {
   
   settings[chatId].wiki = wiki;
   groupStatus[chatId] = 'active';
+  rebuildDispatchIndex();
   
-  if (saveSettings(settings)) {
-    updateGithub(settings).then(success => {
+  const content = saveSettings(settings);
+  if (content) {
+    scheduleGithubSync(content).then(success => {
       const statusMsg = success ? 'and synced with GitHub' : 'but GitHub sync failed';
       bot.sendMessage(chatId, 
         `✅ *Success!* Wiki set to \`${wiki}\` ${statusMsg}. ` +
@@ -390,7 +552,8 @@ bot.onText(/\/setevents (.+)/, async (msg, match) => {
       { parse_mode: 'Markdown' });
   }
 
-  const events = match[1].trim().split(/\s+/);
+  // Store each type once; the dispatch index treats events as a set anyway
+  const events = [...new Set(match[1].trim().split(/\s+/))];
   const validEvents = ['edit', 'new', 'delete', 'move', 'block', 'protect', 'log'];
   const invalidEvents = events.filter(e => !validEvents.includes(e));
   
@@ -408,9 +571,11 @@ bot.onText(/\/setevents (.+)/, async (msg, match) => {
   }
   
   settings[chatId].events = events;
+  rebuildDispatchIndex();
   
-  if (saveSettings(settings)) {
-    updateGithub(settings).then(success => {
+  const content = saveSettings(settings);
+  if (content) {
+    scheduleGithubSync(content).then(success => {
       const statusMsg = success ? 'and synced with GitHub' : 'but GitHub sync failed';
       bot.sendMessage(chatId,
         `✅ *Success!* Events set to: \`${events.join(', ')}\` ${statusMsg}`,
@@ -472,9 +637,11 @@ bot.onText(/\/off/, async (msg) => {
   } else {
     settings[chatId].status = 'paused';
   }
+  rebuildDispatchIndex();
   
-  if (saveSettings(settings)) {
-    updateGithub(settings).then(success => {
+  const content = saveSettings(settings);
+  if (content) {
+    scheduleGithubSync(content).then(success => {
       const statusMsg = success ? 'and synced with GitHub' : 'but GitHub sync failed';
       bot.sendMessage(chatId, 
         `⏸ *Notifications paused* ${statusMsg}. Use /on to resume.`,
@@ -510,9 +677,11 @@ bot.onText(/\/on/, async (msg) => {
   } else {
     settings[chatId].status = 'active';
   }
+  rebuildDispatchIndex();
   
-  if (saveSettings(settings)) {
-    updateGithub(settings).then(success => {
+  const content = saveSettings(settings);
+  if (content) {
+    scheduleGithubSync(content).then(success => {
       const statusMsg = success ? 'and synced with GitHub' : 'but GitHub sync failed';
       bot.sendMessage(chatId, 
         `✅ *Notifications resumed* ${statusMsg}. Use /off to pause.`,
@@ -536,10 +705,23 @@ bot.onText(/\/on/, async (msg) => {
 connectToEventStream();
 console.log('🤖 Bot is running and ready for commands...');
 
-// Cleanup on exit
-process.on('SIGINT', () => {
+// Cleanup on exit: flush pending GitHub sync, but never wait on it for long
+const SHUTDOWN_SYNC_TIMEOUT = 10000;
+let shuttingDown = false;
+
+function shutdown() {
+  // A second signal while we wait forces the exit
+  if (shuttingDown) process.exit();
+  shuttingDown = true;
+
   eventSource?.close();
   notifySystemEvent('Bot Shutdown', 'Bot is shutting down');
   console.log('🛑 Bot shutting down...');
-  process.exit();
-});
+  Promise.race([
+    flushGithubSync(),
+    new Promise(resolve => setTimeout(resolve, SHUTDOWN_SYNC_TIMEOUT))
+  ]).finally(() => process.exit());
+}
+
+process.on('SIGINT', shutdown);
+process.on('SIGTERM', shutdown);
@@ -2,7 +2,8 @@ import { readFileSync, writeFileSync, existsSync } from 'fs';
 import { dirname, join } from 'path';
 import { fileURLToPath } from 'url';
 import got from 'got';
-import { setTimeout } from 'timers/promises';
+import { setTimeout as sleep } from 'timers/promises';
+import { httpsAgent } from './http.js';
 
 const __dirname = dirname(fileURLToPath(import.meta.url));
 const SETTINGS_PATH = join(__dirname, '../settings.json');
@@ -13,9 +14,30 @@ const config = {
   githubRepo: process.env.GITHUB_REPO,
   maxRetries: 3,
   retryDelay: 2000,
-  timeout: 10000
+  timeout: 10000,
+  syncDebounce: 3000
 };
 
+// Statuses GitHub returns when a PUT carries a missing or outdated SHA
+const STALE_SHA_STATUS = [409, 422];
+
+// Last known settings.json blob SHA
+const shaCache = {
+  sha: null
+};
+
+// Shared client so consecutive API calls reuse one keep-alive TLS connection
+const github = got.extend({
+  prefixUrl: 'https://api.github.com',
+  headers: {
+    'Authorization': `token ${config.githubToken}`,
+    'Accept': 'application/vnd.github.v3+json',
+    'User-Agent': 'WikiMonitorBot'
+  },
+  timeout: { request: config.timeout },
+  agent: { https: httpsAgent }
+});
+
 /**
  * GitHub API wrapper with retry logic
  */
@@ -24,25 +46,22 @@ const githubRequest = async (method, endpoint, options = {}) => {
   
   for (let attempt = 1; attempt <= config.maxRetries; attempt++) {
     try {
-      const response = await got(`https://api.github.com${endpoint}`, {
+      const response = await github(endpoint, {
         method,
-        headers: {
-          'Authorization': `token ${config.githubToken}`,
-          'Accept': 'application/vnd.github.v3+json',
-          'User-Agent': 'WikiMonitorBot'
-        },
-        timeout: { request: config.timeout },
         ...options
       });
 
       return response.body ? JSON.parse(response.body) : null;
     } catch (error) {
       lastError = error;
+
+      // A stale SHA won't fix itself; let the caller refresh it instead
+      if (STALE_SHA_STATUS.includes(error.response?.statusCode)) break;
       
       if (attempt < config.maxRetries) {
         const delay = config.retryDelay * attempt;
         console.warn(`⚠️ Attempt ${attempt} failed. Retrying in ${delay}ms...`);
-        await setTimeout(delay);
+        await sleep(delay);
       }
     }
   }
@@ -57,19 +76,24 @@ const getFileSha = async () => {
   try {
     const fileInfo = await githubRequest(
       'GET',
-      `/repos/${config.githubRepo}/contents/settings.json`
+      `repos/${config.githubRepo}/contents/settings.json`
     );
-    return fileInfo?.sha || null;
+    shaCache.sha = fileInfo?.sha || null;
+    return shaCache.sha;
   } catch (error) {
-    if (error.response?.statusCode === 404) return null;
+    if (error.response?.statusCode === 404) {
+      shaCache.sha = null;
+      return null;
+    }
     throw error;
   }
 };
 
 /**
  * Synchronize settings with GitHub repository
+ * @param {string} content - Serialized settings, as written by saveSettings
  */
-export const updateGithub = async (settings) => {
+export const updateGithub = async (content) => {
   // Skip if GitHub integration not configured
   if (!config.githubToken || !config.githubRepo) {
     console.log('ℹ️ GitHub sync disabled - missing token or repo configuration');
@@ -77,17 +101,9 @@ export const updateGithub = async (settings) => {
   }
 
   try {
-    // Ensure local settings file exists
-    if (!existsSync(SETTINGS_PATH)) {
-      writeFileSync(SETTINGS_PATH, JSON.stringify(settings, null, 2));
-    }
-
-    const content = readFileSync(SETTINGS_PATH, 'utf8');
-    const sha = await getFileSha();
-
-    await githubRequest(
+    const putSettings = (sha) => githubRequest(
       'PUT',
-      `/repos/${config.githubRepo}/contents/settings.json`,
+      `repos/${config.githubRepo}/contents/settings.json`,
       {
         json: {
           message: 'Update bot settings',
@@ -98,6 +114,17 @@ export const updateGithub = async (settings) => {
       }
     );
 
+    // PUT straight away with the SHA from our last write; only look it up
+    // when we have none or it turns out to be stale
+    let result;
+    try {
+      result = await putSettings(shaCache.sha ?? await getFileSha());
+    } catch (error) {
+      if (!STALE_SHA_STATUS.includes(error.response?.statusCode)) throw error;
+      result = await putSettings(await getFileSha());
+    }
+    shaCache.sha = result?.content?.sha || null;
+
     console.log('✅ Settings successfully synced with GitHub');
     return true;
   } catch (error) {
@@ -120,6 +147,52 @@ export const updateGithub = async (settings) => {
   }
 };
 
+// Debounced sync state: one pending flush at a time, flushes run in sequence
+const pendingSync = {
+  timer: null,
+  promise: null,
+  run: null,
+  content: null
+};
+let lastSync = Promise.resolve(true);
+
+/**
+ * Schedule a settings sync, coalescing bursts of changes into a single commit
+ * Every caller within the debounce window receives the same result promise
+ */
+export const scheduleGithubSync = (content) => {
+  // Nothing to wait for when the integration isn't configured
+  if (!config.githubToken || !config.githubRepo) return Promise.resolve(false);
+
+  pendingSync.content = content;
+
+  if (!pendingSync.promise) {
+    pendingSync.promise = new Promise(resolve => {
+      pendingSync.run = () => {
+        clearTimeout(pendingSync.timer);
+        pendingSync.timer = null;
+        pendingSync.promise = null;
+        pendingSync.run = null;
+        const latest = pendingSync.content;
+        pendingSync.content = null;
+        lastSync = lastSync.then(() => updateGithub(latest));
+        resolve(lastSync);
+      };
+      pendingSync.timer = setTimeout(pendingSync.run, config.syncDebounce);
+    });
+  }
+
+  return pendingSync.promise;
+};
+
+/**
+ * Run any pending sync immediately (e.g. on shutdown)
+ */
+export const flushGithubSync = () => {
+  pendingSync.run?.();
+  return lastSync;
+};
+
 /**
  * Initialize GitHub synchronization (optional)
  */
@@ -135,10 +208,10 @@ export const initGithubSync = async () => {
     
     // Create initial settings file if doesn't exist
     if (!existsSync(SETTINGS_PATH)) {
-      writeFileSync(SETTINGS_PATH, JSON.stringify({}, null, 2));
+      writeFileSync(SETTINGS_PATH, JSON.stringify({}));
     }
     
-    await updateGithub({});
+    await updateGithub(readFileSync(SETTINGS_PATH, 'utf8'));
     return true;
   } catch (error) {
     console.error('❌ Failed to initialize GitHub sync:', error.message);
@@ -0,0 +1,17 @@
+import { Agent } from 'https';
+
+// Concurrent Telegram notification sends (see the send queue in bot.js)
+export const MAX_CONCURRENT_SENDS = 20;
+
+/**
+ * Shared keep-alive agent for outbound HTTPS (Telegram and GitHub APIs)
+ * Reuses TLS connections across requests and caps the sockets we open.
+ * Per-host room covers every concurrent send plus the getUpdates long poll,
+ * the admin notifier and a little headroom, all on api.telegram.org.
+ */
+export const httpsAgent = new Agent({
+  keepAlive: true,
+  timeout: 75000, // Close sockets left idle in the pool after 75s
+  maxSockets: MAX_CONCURRENT_SENDS + 4,
+  maxTotalSockets: 64
+});
@@ -1,7 +1,12 @@
 import TelegramBot from 'node-telegram-bot-api';
+import { httpsAgent } from './http.js';
 
 const ADMIN_CHAT_ID = process.env.ADMIN_CHAT_ID;
-const bot = new TelegramBot(process.env.TELEGRAM_BOT_TOKEN);
+const bot = new TelegramBot(process.env.TELEGRAM_BOT_TOKEN, {
+  request: {
+    agent: httpsAgent
+  }
+});
 
 const notificationQueue = [];
 let isProcessing = false;
@@ -1,15 +1,24 @@
-import { readFileSync, writeFileSync, existsSync } from 'fs';
+import { readFileSync, writeFileSync, existsSync, statSync } from 'fs';
 import { dirname, join } from 'path';
 import { fileURLToPath } from 'url';
 
 const __dirname = dirname(fileURLToPath(import.meta.url));
 const SETTINGS_PATH = join(__dirname, '../settings.json');
 
+// Last parsed settings, keyed on the file's mtime
+let cached = { mtimeMs: 0, data: null };
+
 export const loadSettings = () => {
   try {
     if (existsSync(SETTINGS_PATH)) {
+      const { mtimeMs } = statSync(SETTINGS_PATH);
+      if (cached.data && cached.mtimeMs === mtimeMs) {
+        return cached.data;
+      }
+
       const data = readFileSync(SETTINGS_PATH, 'utf8');
-      return JSON.parse(data);
+      cached = { mtimeMs, data: JSON.parse(data) };
+      return cached.data;
     }
     return {};
   } catch (err) {
@@ -18,11 +27,17 @@ export const loadSettings = () => {
   }
 };
 
+/**
+ * Write settings to disk
+ * @returns {string|false} The serialized JSON that was written, or false on failure
+ */
 export const saveSettings = (settings) => {
   try {
-    writeFileSync(SETTINGS_PATH, JSON.stringify(settings, null, 2));
+    const content = JSON.stringify(settings);
+    writeFileSync(SETTINGS_PATH, content);
+    cached = { mtimeMs: statSync(SETTINGS_PATH).mtimeMs, data: settings };
     console.log('💾 Settings saved to', SETTINGS_PATH);
-    return true;
+    return content;
   } catch (err) {
     console.error('❌ Error saving settings:', err.message);
     return false;